@@ -2,35 +2,84 @@
 """
 A Pythonic stepfile runner with DAG-based dependency management and group support.
 """
+import array
+import codecs
 import logging
+import mmap
 import os
 import re
+import selectors
 import shlex
+import shutil
 import subprocess
-from collections import defaultdict, deque
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterator, List, Optional, Set
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(message)s',
     datefmt='%H:%M:%S'
 )
+log = logging.getLogger(__name__)
+
+# Annotation and dependency-list patterns, compiled once at import time
+_LINE_RE = re.compile(
+    r'^(?:@group\((?P<grp>[\w\-]+)\)'
+    r'|@depends\((?P<deps>[\w\-,\s]+)\)'
+    r'|@depends_group\((?P<gdeps>[\w\-,\s]+)\))'
+    r'\s+(?:(?P<name>\w[\w\-]*)\s*=\s*)?(?P<cmd>.+)$'
+)
+_DEP_SPLIT_RE = re.compile(r'[\s,]+')
+
+# Slotted dataclasses drop the per-instance __dict__; slots=True needs Python 3.10+
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+# First byte of a comment line in the raw Stepfile
+_COMMENT_BYTE = ord('#')
+
+# Shared result of StepfileRunner._classify_line() for blank and comment lines
+_SKIP_LINE = ('skip',)
+
+# Maximum bytes read from a command's stdout/stderr pipe at a time
+_READ_CHUNK_SIZE = 64 * 1024
+
+# Popen only launches with posix_spawn() when it can still honour the default
+# close_fds=True, which needs POSIX_SPAWN_CLOSEFROM (CPython 3.13+)
+_CAN_POSIX_SPAWN = (getattr(subprocess, '_USE_POSIX_SPAWN', False)
+                    and getattr(subprocess, '_HAVE_POSIX_SPAWN_CLOSEFROM', False))
+
+# Factory for the incremental decoders used on command output
+_utf8_decoder = codecs.getincrementaldecoder('utf-8')
 
 
-@dataclass
+class _VariableMap(dict):
+    """Lookup for expanded variables.
+
+    Unknown names expand back to their literal $NAME$ form.
+    """
+
+    def __missing__(self, key: str) -> str:
+        return f'${key}$'
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class Command:
     """Represents a command with dependencies and groups."""
     name: Optional[str]
     cmd: str
     depends_on: List[str] = field(default_factory=list)
     groups: List[str] = field(default_factory=list)  # New: groups this command belongs to
+    argv: List[str] = field(default_factory=list)  # Expanded, tokenized command
+    idx: Optional[int] = None  # Position among named commands, used by the scheduler
     process: Optional[subprocess.Popen] = None
     exit_code: Optional[int] = None
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class StepfileConfig:
     """Configuration parsed from a Stepfile."""
     variables: Dict[str, str]
@@ -38,6 +87,8 @@ class StepfileConfig:
     named_commands: Dict[str, Command]
     unnamed_commands: List[Command]
     groups: Dict[str, Set[str]] = field(default_factory=dict)  # New: group -> command names
+    reverse_adj: List[List[int]] = field(default_factory=list)  # command id -> dependent ids
+    in_degree_initial: List[int] = field(default_factory=list)  # command id -> dependency count
 
 
 class StepfileRunner:
@@ -46,162 +97,230 @@ class StepfileRunner:
     def __init__(self, stepfile_path: str = "Stepfile"):
         self.stepfile_path = Path(stepfile_path)
         self.config: Optional[StepfileConfig] = None
+        self._env_base: Dict[str, str] = {}
+        self._merged_env: Optional[dict] = None
+        self._command_path: Optional[str] = None
+        self._expand_cache: Dict[str, str] = {}
+        self._argv_cache: Dict[str, List[str]] = {}
+        self._variable_map = _VariableMap()
 
     def parse(self) -> StepfileConfig:
         """Parse the stepfile and extract configuration with dependencies and groups."""
         if not self.stepfile_path.exists():
             raise FileNotFoundError(f"Stepfile not found: {self.stepfile_path}")
 
-        variables = {}
-        shell_env = {}
-        named_commands = {}
-        unnamed_commands = []
-        groups = defaultdict(set)  # group_name -> set of command names
-
-        with self.stepfile_path.open('r') as f:
-            lines = f.readlines()
+        self.config = self._parse_file(self.stepfile_path)
+        variables = self.config.variables
+        shell_env = self.config.shell_env
+        named_commands = self.config.named_commands
+        unnamed_commands = self.config.unnamed_commands
 
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            i += 1
+        # Expand group dependencies
+        self._expand_group_dependencies()
 
-            if not line or line.startswith('#'):
-                continue
+        # Number named commands and precompute the scheduler's graph
+        self._build_graph()
 
-            # Check for @group annotation
-            if line.startswith('@group'):
-                group_name, name, cmd = self._parse_group_line(line)
-                if name:
-                    command = Command(name=name, cmd=cmd, groups=[group_name])
-                    named_commands[name] = command
-                    groups[group_name].add(name)
-                else:
-                    unnamed_commands.append(Command(name=None, cmd=cmd, groups=[group_name]))
-                continue
+        # Snapshot os.environ once per parse; expansion and the command
+        # environment are both built from this copy.
+        self._env_base = dict(os.environ)
 
-            # Check for @depends annotation
-            if line.startswith('@depends'):
-                deps, name, cmd = self._parse_depends_line(line)
-                if name:
-                    named_commands[name] = Command(name=name, cmd=cmd, depends_on=deps)
-                else:
-                    unnamed_commands.append(Command(name=None, cmd=cmd, depends_on=deps))
-                continue
-
-            # Check for @depends_group annotation
-            if line.startswith('@depends_group'):
-                group_deps, name, cmd = self._parse_depends_group_line(line)
-                if name:
-                    named_commands[name] = Command(name=name, cmd=cmd, depends_on=group_deps)
-                else:
-                    unnamed_commands.append(Command(name=None, cmd=cmd, depends_on=group_deps))
-                continue
+        # Expand variables and tokenize once, so run() only has to spawn.
+        # Stepfile variables win over the environment; empty values fall through.
+        variable_map = _VariableMap(
+            (sys.intern(var_name), var_value)
+            for source in (self._env_base, variables)
+            for var_name, var_value in source.items()
+            if var_value
+        )
+        # Cached expansions stay valid across re-parses until a value changes
+        if variable_map != self._variable_map:
+            self._variable_map = variable_map
+            self._expand_cache.clear()
+        commands = [*named_commands.values(), *unnamed_commands]
+        expanded_cmds = set()
+        for command in commands:
+            # cmd keeps the raw template for logging; only argv holds values
+            expanded = self._expand_variables(command.cmd)
+            expanded_cmds.add(expanded)
+            command.argv = self._tokenize(expanded)
+
+        # Keep only the cache entries this Stepfile still uses, so a
+        # long-lived runner re-parsing an edited file does not accumulate them
+        raw_cmds = {command.cmd for command in commands}
+        self._expand_cache = {
+            text: expanded for text, expanded in self._expand_cache.items() if text in raw_cmds
+        }
+        self._argv_cache = {
+            text: argv for text, argv in self._argv_cache.items() if text in expanded_cmds
+        }
+
+        # Build the command environment once; shell_env only changes on parse.
+        # Without shell variables, Popen can inherit our environment as-is.
+        merged_env = {**self._env_base, **shell_env} if shell_env else None
+        # Without a merged environment the child inherits the live os.environ,
+        # so executables are then looked up on its PATH rather than the snapshot
+        self._command_path = merged_env.get('PATH', os.defpath) if merged_env is not None else None
+        if merged_env is not None and os.name == 'posix':
+            # Popen fsencodes every str entry on each spawn; bytes pass straight through
+            merged_env = {os.fsencode(key): os.fsencode(value) for key, value in merged_env.items()}
+        self._merged_env = merged_env
+        return self.config
 
-            # Check for variable assignment
-            elif self._is_variable_assignment(line):
-                var_name, var_value = self._parse_assignment(line)
+    @staticmethod
+    def _parse_file(path: Path) -> StepfileConfig:
+        """Parse a Stepfile into an unexpanded configuration."""
+        variables = {}
+        shell_env = {}
+        named_commands = {}
+        unnamed_commands = []
+        groups = defaultdict(set)  # group_name -> set of command names
 
-                if var_name.endswith('.sh'):
-                    shell_env[var_name[:-3]] = var_value
-                else:
-                    variables[var_name] = var_value
-            # Check for named command (name = command)
-            elif '=' in line and not line.startswith('$'):
-                name, cmd = line.split('=', 1)
-                name = name.strip()
-                cmd = cmd.strip()
-                named_commands[name] = Command(
-                    name=name,
-                    cmd=cmd,
+        # Classify every line in one comprehension, dropping blanks and comments
+        classify = StepfileRunner._classify_line
+        entries = [
+            entry for raw in StepfileRunner._read_lines(path)
+            if (entry := classify(raw.strip())) is not _SKIP_LINE
+        ]
+
+        for entry in entries:
+            kind = entry[0]
+            if kind == 'env':
+                shell_env[entry[1]] = entry[2]
+            elif kind == 'var':
+                variables[entry[1]] = entry[2]
+            elif kind == 'named':
+                named_commands[entry[1]] = Command(
+                    name=entry[1],
+                    cmd=entry[2],
                     depends_on=[]
                 )
-            # Regular unnamed command
-            else:
+            elif kind == 'cmd':
                 unnamed_commands.append(Command(
                     name=None,
-                    cmd=line,
+                    cmd=entry[1],
                     depends_on=[]
                 ))
+            else:
+                # Annotated command: @group(...), @depends(...) or @depends_group(...)
+                match = entry[1]
+                name = match.group('name')
+                cmd = match.group('cmd').strip()
+                group_name = match.group('grp')
+                if group_name is not None:
+                    command = Command(name=name, cmd=cmd, groups=[group_name])
+                    if name:
+                        groups[group_name].add(name)
+                else:
+                    dep_list = match.group('deps') or match.group('gdeps')
+                    deps = [d for d in _DEP_SPLIT_RE.split(dep_list.strip()) if d]
+                    command = Command(name=name, cmd=cmd, depends_on=deps)
 
-        self.config = StepfileConfig(
+                if name:
+                    named_commands[name] = command
+                else:
+                    unnamed_commands.append(command)
+
+        return StepfileConfig(
             variables=variables,
             shell_env=shell_env,
             named_commands=named_commands,
             unnamed_commands=unnamed_commands,
             groups=dict(groups)
         )
-        
-        # Expand group dependencies
-        self._expand_group_dependencies()
-        return self.config
 
     @staticmethod
-    def _parse_depends_line(line: str) -> tuple[List[str], Optional[str], str]:
+    def _classify_line(line: str) -> tuple:
         """
-        Parse @depends annotation.
-        Formats:
-          @depends(cmd1, cmd2) name = command
-          @depends(cmd1) command
+        Classify one stripped Stepfile line in a single pass.
+        Returns a tagged tuple: ('skip',), ('annotation', match),
+        ('env', name, value), ('var', name, value), ('named', name, command)
+        or ('cmd', line).
         """
-        # Try with name assignment
-        match = re.match(r'@depends\(([\w\-,\s]+)\)\s+(\w[\w\-]*)\s*=\s*(.+)', line)
-        if match:
-            deps = [d.strip() for d in match.group(1).split(',')]
-            name = match.group(2)
-            cmd = match.group(3).strip()
-            return deps, name, cmd
-
-        # Try without name (unnamed command with dependencies)
-        match = re.match(r'@depends\(([\w\-,\s]+)\)\s+(.+)', line)
-        if match:
-            deps = [d.strip() for d in match.group(1).split(',')]
-            cmd = match.group(2).strip()
-            return deps, None, cmd
-
-        raise ValueError(f"Invalid @depends syntax: {line}")
-
-    @staticmethod
-    def _parse_group_line(line: str) -> tuple[str, Optional[str], str]:
-        """Parse @group annotation.
-        Format: @group(group_name) [name =] command
+        if not line:
+            return _SKIP_LINE
+
+        # Classify on the first character; only '@' lines need the regex.
+        # A malformed @group/@depends line is an error, but any other '@'
+        # line is left to the assignment and command rules below.
+        first = line[0]
+        if first == '#':
+            return _SKIP_LINE
+        if first == '@':
+            match = _LINE_RE.match(line)
+            if match:
+                return ('annotation', match)
+            if line.startswith(('@group', '@depends')):
+                raise ValueError(f"Invalid annotation syntax: {line}")
+
+        # Split "name = value" once and reuse both halves. The line is already
+        # stripped, so each half only needs trimming on its inner side.
+        name, eq, value = line.partition('=')
+        if eq:
+            name = name.rstrip()
+            value = value.lstrip()
+
+            # Variable assignments are UPPER_CASE or end with .sh. Their names
+            # are interned so expansion lookups can match them by identity.
+            if name.endswith('.sh'):
+                return ('env', sys.intern(name[:-3]), value)
+            if name.isupper():
+                return ('var', sys.intern(name), value)
+            if first != '$':
+                return ('named', name, value)
+
+        return ('cmd', line)
+
+    def _build_graph(self):
         """
-        # With name assignment
-        match = re.match(r'@group\(([\w\-]+)\)\s+(\w[\w\-]*)\s*=\s*(.+)', line)
-        if match:
-            return match.group(1), match.group(2), match.group(3).strip()
+        Number named commands and record reverse edges and in-degrees over
+        those integer ids. The graph is immutable after parsing, so every
+        scheduling pass can reuse it. Unknown dependencies are skipped here
+        and reported by the schedulers, so the graph can still be visualized.
+        """
+        named_commands = self.config.named_commands
+        for idx, command in enumerate(named_commands.values()):
+            command.idx = idx
 
-        # Without name (unnamed command)
-        match = re.match(r'@group\(([\w\-]+)\)\s+(.+)', line)
-        if match:
-            return match.group(1), None, match.group(2).strip()
+        reverse_adj: List[List[int]] = [[] for _ in named_commands]
+        in_degree = [0] * len(named_commands)
+        for command in named_commands.values():
+            for dep in command.depends_on:
+                dep_cmd = named_commands.get(dep)
+                if dep_cmd is None:
+                    continue
+                reverse_adj[dep_cmd.idx].append(command.idx)
+                in_degree[command.idx] += 1
 
-        raise ValueError(f"Invalid @group syntax: {line}")
+        self.config.reverse_adj = reverse_adj
+        self.config.in_degree_initial = in_degree
 
     @staticmethod
-    def _parse_depends_group_line(line: str) -> tuple[List[str], Optional[str], str]:
-        """Parse @depends_group annotation.
-        Format: @depends_group(group1, group2) [name =] command
+    def _read_lines(path: Path) -> Iterator[str]:
+        """
+        Yield the Stepfile's lines from a read-only memory map, so large
+        generated Stepfiles are never copied into one Python string.
+        Blank and comment lines are dropped as bytes, before any decoding.
         """
-        # With name assignment
-        match = re.match(r'@depends_group\(([\w\-,\s]+)\)\s+(\w[\w\-]*)\s*=\s*(.+)', line)
-        if match:
-            groups = [g.strip() for g in match.group(1).split(',')]
-            name = match.group(2)
-            cmd = match.group(3).strip()
-            return groups, name, cmd
-
-        # Without name
-        match = re.match(r'@depends_group\(([\w\-,\s]+)\)\s+(.+)', line)
-        if match:
-            groups = [g.strip() for g in match.group(1).split(',')]
-            cmd = match.group(2).strip()
-            return groups, None, cmd
-
-        raise ValueError(f"Invalid @depends_group syntax: {line}")
+        with path.open('rb') as f:
+            # mmap cannot map an empty file
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # readline() benchmarked faster here than one multiline
+                # regex finditer() over the whole map
+                for raw in iter(mm.readline, b''):
+                    stripped = raw.strip()
+                    # Indexing bytes gives an int: a single compare, no method call
+                    if stripped and stripped[0] != _COMMENT_BYTE:
+                        yield stripped.decode('utf-8')
 
     def _expand_group_dependencies(self):
         """Expand group dependencies into individual command dependencies."""
+        # Without groups there is nothing to expand
+        if not self.config.groups:
+            return
+
         for cmd_name, command in self.config.named_commands.items():
             expanded_deps = []
             for dep in command.depends_on:
@@ -222,107 +341,266 @@ class StepfileRunner:
                     expanded_deps.append(dep)
             command.depends_on = expanded_deps
 
-    @staticmethod
-    def _is_variable_assignment(line: str) -> bool:
-        """Check if line is a variable assignment (not a command)."""
-        # Variable assignments are uppercase by convention
-        if '=' not in line:
-            return False
-        var_name = line.split('=', 1)[0].strip()
-        # Consider it a variable if it's UPPER_CASE or ends with .sh
-        return var_name.isupper() or var_name.endswith('.sh')
+    def _expand_variables(self, text: str) -> str:
+        """
+        Expand variables in the format $VAR$.
+        Makes one pass over the text with a dict lookup per token, so the cost
+        does not grow with the number of variables defined.
+        """
+        # Most commands contain no tokens at all; skip the scan and the cache
+        if '$' not in text:
+            return text
 
-    @staticmethod
-    def _parse_assignment(line: str) -> tuple[str, str]:
-        """Parse a variable assignment line."""
-        var_name, var_value = line.split('=', 1)
-        return var_name.strip(), var_value.strip()
+        cached = self._expand_cache.get(text)
+        if cached is not None:
+            return cached
 
-    def _expand_variables(self, text: str) -> str:
-        """Expand variables in the format $VAR$."""
-        def replacer(match):
-            var_name = match.group(1)
-            return (
-                self.config.variables.get(var_name) or
-                os.environ.get(var_name) or
-                match.group(0)
-            )
+        # Scan for $NAME$ tokens with str.find instead of running a regex
+        parts = []
+        i = 0
+        while True:
+            start = text.find('$', i)
+            end = text.find('$', start + 1) if start >= 0 else -1
+            if end < 0:
+                parts.append(text[i:])
+                break
+
+            name = text[start + 1:end]
+            if name.isidentifier() and name.isascii():
+                parts.append(text[i:start])
+                parts.append(self._variable_map[sys.intern(name)])
+                i = end + 1
+            else:
+                # Not a token, but its closing '$' may open the next one
+                parts.append(text[i:end])
+                i = end
+
+        expanded = ''.join(parts)
+        self._expand_cache[text] = expanded
+        return expanded
+
+    def _tokenize(self, text: str) -> List[str]:
+        """
+        Split an expanded command into argv with shlex, caching the tokens so
+        a re-parse does not tokenize the same command again.
+        """
+        argv = self._argv_cache.get(text)
+        if argv is None:
+            argv = self._argv_cache[text] = shlex.split(text)
+        return list(argv)
+
+    def _topological_batches(self) -> List[List[Command]]:
+        """
+        Group commands into batches using Kahn's algorithm, one layer at a time.
+        Commands within a batch do not depend on each other, so a batch can be
+        launched concurrently. Unnamed commands form the final batch.
+        """
+        named_commands = self.config.named_commands
+        commands = list(named_commands.values())
+        for command in commands:
+            for dep in command.depends_on:
+                if dep not in named_commands:
+                    raise ValueError(f"Unknown dependency: '{dep}' required by '{command.name}'")
+
+        # The graph is precomputed by parse(); only the in-degrees are consumed
+        dependents = self.config.reverse_adj
+        in_degree = array.array('i', self.config.in_degree_initial)
+
+        # The first batch is every node with no dependencies
+        batch = [idx for idx, degree in enumerate(in_degree) if degree == 0]
+        batches = []
+        emitted = 0
+
+        while batch:
+            batches.append([commands[idx] for idx in batch])
+            emitted += len(batch)
+
+            # Reduce in-degree for dependent commands; those reaching zero form the next batch
+            next_batch = []
+            for idx in batch:
+                for dependent in dependents[idx]:
+                    in_degree[dependent] -= 1
+                    if in_degree[dependent] == 0:
+                        next_batch.append(dependent)
+            batch = next_batch
+
+        # Check for circular dependencies
+        if emitted != len(commands):
+            remaining = {commands[idx].name for idx, degree in enumerate(in_degree) if degree > 0}
+            raise ValueError(f"Circular dependency detected involving: {remaining}")
+
+        # Add unnamed commands at the end (they run after all named commands)
+        if self.config.unnamed_commands:
+            batches.append(list(self.config.unnamed_commands))
 
-        return re.sub(r'\$(\w+)\$', replacer, text)
+        return batches
 
     def _topological_sort(self) -> List[Command]:
         """
-        Sort commands using topological sort (Kahn's algorithm).
+        Sort commands using an iterative depth-first search (post-order).
         Returns commands in execution order.
         """
-        # Build dependency graph
-        in_degree = defaultdict(int)
-        graph = defaultdict(list)
-        all_commands = {name: cmd for name, cmd in self.config.named_commands.items()}
-
-        # Calculate in-degrees
-        for name, cmd in all_commands.items():
-            if name not in in_degree:
-                in_degree[name] = 0
-
-            for dep in cmd.depends_on:
-                if dep not in all_commands:
-                    raise ValueError(f"Unknown dependency: '{dep}' required by '{name}'")
-                graph[dep].append(name)
-                in_degree[name] += 1
-
-        # Find all nodes with no dependencies
-        queue = deque([cmd for name, cmd in all_commands.items()
-                       if in_degree[name] == 0])
+        named_commands = self.config.named_commands
         sorted_commands = []
+        visited: Set[str] = set()
+        on_stack: Set[str] = set()
 
-        while queue:
-            cmd = queue.popleft()
-            sorted_commands.append(cmd)
-
-            # Reduce in-degree for dependent commands
-            if cmd.name:
-                for dependent_name in graph[cmd.name]:
-                    in_degree[dependent_name] -= 1
-                    if in_degree[dependent_name] == 0:
-                        queue.append(all_commands[dependent_name])
+        for root in named_commands:
+            if root in visited:
+                continue
 
-        # Check for circular dependencies
-        if len(sorted_commands) != len(all_commands):
-            remaining = set(all_commands.keys()) - {cmd.name for cmd in sorted_commands}
-            raise ValueError(f"Circular dependency detected involving: {remaining}")
+            # Each frame holds a command name and an iterator over its dependencies
+            stack = [(root, iter(named_commands[root].depends_on))]
+            on_stack.add(root)
+
+            while stack:
+                name, deps = stack[-1]
+                for dep in deps:
+                    if dep not in named_commands:
+                        raise ValueError(f"Unknown dependency: '{dep}' required by '{name}'")
+                    if dep in on_stack:
+                        path = [frame_name for frame_name, _ in stack]
+                        cycle = set(path[path.index(dep):])
+                        raise ValueError(f"Circular dependency detected involving: {cycle}")
+                    if dep not in visited:
+                        on_stack.add(dep)
+                        stack.append((dep, iter(named_commands[dep].depends_on)))
+                        break
+                else:
+                    # All dependencies emitted, so this command can follow them
+                    stack.pop()
+                    on_stack.discard(name)
+                    visited.add(name)
+                    sorted_commands.append(named_commands[name])
 
         # Add unnamed commands at the end (they run after all named commands)
         sorted_commands.extend(self.config.unnamed_commands)
 
         return sorted_commands
 
+    def _resolve_executable(self, program: str) -> Optional[str]:
+        """
+        Return the absolute path of a program on the command's PATH, if found.
+        Only called where it lets Popen use posix_spawn(). There, a few stat()
+        calls per spawn are cheaper than the fork() they replace. The lookup
+        is not cached, since earlier steps may install or shadow binaries.
+        """
+        return shutil.which(program, path=self._command_path)
+
     def execute_command(self, command: Command) -> None:
         """Execute a single command and store the process."""
-        expanded_command = self._expand_variables(command.cmd)
-        cmd_parts = shlex.split(expanded_command)
-
-        # Build environment with shell variables
-        env = {**os.environ, **self.config.shell_env}
-
-        logging.info(f"Executing: {command.name or command.cmd}")
-        logging.debug(f"  Command: {' '.join(cmd_parts)}")
-
+        log.info("Executing: %s", command.name or command.cmd)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("  Command: %s", ' '.join(command.argv))
+
+        # Where Popen can use posix_spawn() it also needs an absolute
+        # executable; elsewhere it will fork()+exec() regardless, so the PATH
+        # lookup is left to it.
+        # close_fds keeps its default, so descriptors the runner itself
+        # inherited are never passed on to commands.
+        executable = self._resolve_executable(command.argv[0]) if _CAN_POSIX_SPAWN else None
         command.process = subprocess.Popen(
-            cmd_parts,
-            env=env,
+            command.argv,
+            executable=executable,
+            env=self._merged_env,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             shell=False
         )
 
+    @staticmethod
+    def _log_output(command: Command, stream: str, text: str) -> None:
+        """Log decoded command output at debug level."""
+        if text:
+            log.debug("  [%s] %s: %s", command.name or command.cmd, stream, text.rstrip())
+
+    def _launch_all(self, commands: List[Command]) -> None:
+        """
+        Start every command before waiting on any of them, so their process
+        creation and run time overlap. If one fails to launch, the ones
+        already started are killed and reaped before the error propagates.
+        """
+        started: List[subprocess.Popen] = []
+        try:
+            for command in commands:
+                self.execute_command(command)
+                started.append(command.process)
+        except BaseException:
+            for process in started:
+                process.kill()
+                process.wait()
+                process.stdout.close()
+                process.stderr.close()
+            raise
+
+    def _drain(self, commands: List[Command]) -> None:
+        """
+        Stream the output of running commands into the log until they exit.
+        Pipes are read as data arrives instead of buffering whole outputs.
+        """
+        # Output is only decoded and kept around if it will be logged
+        debug = log.isEnabledFor(logging.DEBUG)
+
+        if sys.platform == 'win32':
+            # select() only supports sockets on Windows, so drain each
+            # process's pipes on its own worker thread instead
+            with ThreadPoolExecutor(max_workers=min(32, len(commands)) or 1) as executor:
+                outputs = list(executor.map(lambda cmd: cmd.process.communicate(), commands))
+            for cmd, (stdout, stderr) in zip(commands, outputs):
+                if debug:
+                    self._log_output(cmd, 'stdout', stdout.decode(errors='replace'))
+                    self._log_output(cmd, 'stderr', stderr.decode(errors='replace'))
+                cmd.exit_code = cmd.process.returncode
+            return
+
+        # When logging, each pipe holds back a partial line until a newline
+        # arrives or it outgrows one read, and decodes incrementally so a
+        # multi-byte UTF-8 character split across reads stays intact
+        pending: Dict[int, bytearray] = {}
+        decoders: Dict[int, codecs.IncrementalDecoder] = {}
+        with selectors.DefaultSelector() as selector:
+            for cmd in commands:
+                for stream, pipe in (('stdout', cmd.process.stdout), ('stderr', cmd.process.stderr)):
+                    key = selector.register(pipe, selectors.EVENT_READ, (cmd, stream))
+                    if debug:
+                        pending[key.fd] = bytearray()
+                        decoders[key.fd] = _utf8_decoder(errors='replace')
+
+            while selector.get_map():
+                for key, _ in selector.select():
+                    chunk = os.read(key.fd, _READ_CHUNK_SIZE)
+                    if debug:
+                        cmd, stream = key.data
+                        buffer = pending[key.fd]
+                        decoder = decoders[key.fd]
+                        if not chunk:
+                            self._log_output(cmd, stream, decoder.decode(buffer, final=True))
+                        else:
+                            # Pending bytes hold no newline, so only the new chunk is searched
+                            end = chunk.rfind(b'\n') + 1
+                            if end:
+                                buffer += chunk[:end]
+                                self._log_output(cmd, stream, decoder.decode(buffer))
+                                buffer[:] = chunk[end:]
+                            else:
+                                buffer += chunk
+                                if len(buffer) > _READ_CHUNK_SIZE:
+                                    self._log_output(cmd, stream, decoder.decode(buffer))
+                                    buffer.clear()
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+
+        for cmd in commands:
+            cmd.exit_code = cmd.process.wait()
+
     def run(self, *, stop_on_error: bool = True, parallel: bool = False) -> Dict[str, Command]:
         """
         Run all commands respecting dependencies.
 
         Args:
             stop_on_error: Stop execution if a command fails
-            parallel: Run independent commands in parallel (not fully implemented)
+            parallel: Launch each batch of mutually independent commands concurrently
 
         Returns:
             Dictionary of command name -> Command (with exit codes)
@@ -330,52 +608,54 @@ class StepfileRunner:
         if self.config is None:
             self.parse()
 
-        sorted_commands = self._topological_sort()
+        if parallel:
+            batches = self._topological_batches()
+        else:
+            batches = [[cmd] for cmd in self._topological_sort()]
         completed: Set[str] = set()
         results = {}
 
-        logging.info(f"Executing {len(sorted_commands)} commands...")
+        log.info("Executing %d commands...", sum(len(batch) for batch in batches))
 
-        for cmd in sorted_commands:
-            # Verify all dependencies completed successfully
-            for dep in cmd.depends_on:
-                if dep not in completed:
-                    raise RuntimeError(f"Dependency '{dep}' not completed for '{cmd.name or cmd.cmd}'")
+        for batch in batches:
+            for cmd in batch:
+                # Verify all dependencies completed successfully
+                for dep in cmd.depends_on:
+                    if dep not in completed:
+                        raise RuntimeError(f"Dependency '{dep}' not completed for '{cmd.name or cmd.cmd}'")
 
-                dep_cmd = results[dep]
-                if dep_cmd.exit_code != 0:
-                    logging.error(f"Skipping '{cmd.name or cmd.cmd}' - dependency '{dep}' failed")
-                    if stop_on_error:
-                        return results
-                    continue
+                    dep_cmd = results[dep]
+                    if dep_cmd.exit_code != 0:
+                        log.error("Skipping '%s' - dependency '%s' failed", cmd.name or cmd.cmd, dep)
+                        if stop_on_error:
+                            return results
+                        continue
 
-            # Execute the command
-            self.execute_command(cmd)
+            self._launch_all(batch)
 
-            # Wait for completion
-            stdout, stderr = cmd.process.communicate()
-            cmd.exit_code = cmd.process.returncode
+            # Wait for completion, logging output as it arrives
+            self._drain(batch)
 
-            # Log output
-            if stdout:
-                logging.debug(f"  stdout: {stdout.decode().strip()}")
-            if stderr:
-                logging.debug(f"  stderr: {stderr.decode().strip()}")
+            failed = False
+            for cmd in batch:
+                if cmd.exit_code == 0:
+                    log.info("✓ Success: %s", cmd.name or cmd.cmd)
+                else:
+                    log.error("✗ Failed: %s (exit code: %s)", cmd.name or cmd.cmd, cmd.exit_code)
+                    if stop_on_error:
+                        failed = True
+                        continue
 
-            if cmd.exit_code == 0:
-                logging.info(f"✓ Success: {cmd.name or cmd.cmd}")
-            else:
-                logging.error(f"✗ Failed: {cmd.name or cmd.cmd} (exit code: {cmd.exit_code})")
-                if stop_on_error:
-                    logging.error("Stopping execution due to failure")
-                    return results
+                # Mark as completed
+                if cmd.name:
+                    completed.add(cmd.name)
+                    results[cmd.name] = cmd
 
-            # Mark as completed
-            if cmd.name:
-                completed.add(cmd.name)
-                results[cmd.name] = cmd
+            if failed:
+                log.error("Stopping execution due to failure")
+                return results
 
-        logging.info(f"Execution complete: {len(completed)} commands succeeded")
+        log.info("Execution complete: %d commands succeeded", len(completed))
         return results
 
     def visualize_dag(self) -> str:
@@ -406,11 +686,10 @@ class StepfileRunner:
 
 def main():
     """Main entry point."""
-    import sys
-
     # Check for flags
     visualize = '--visualize' in sys.argv or '-v' in sys.argv
     debug = '--debug' in sys.argv or '-d' in sys.argv
+    parallel = '--parallel' in sys.argv or '-p' in sys.argv
 
     if debug:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -423,23 +702,23 @@ def main():
             print(runner.visualize_dag())
             return
 
-        results = runner.run(stop_on_error=True)
+        results = runner.run(stop_on_error=True, parallel=parallel)
 
         # Exit with error if any command failed
         failed = [name for name, cmd in results.items() if cmd.exit_code != 0]
         if failed:
-            logging.error(f"Failed commands: {', '.join(failed)}")
+            log.error("Failed commands: %s", ', '.join(failed))
             sys.exit(1)
 
     except FileNotFoundError as e:
-        logging.error(f"{e}")
+        log.error("%s", e)
         print("No steps available")
         sys.exit(100)
     except ValueError as e:
-        logging.error(f"Configuration error: {e}")
+        log.error("Configuration error: %s", e)
         sys.exit(2)
     except Exception as e:
-        logging.error(f"Unexpected error: {e}", exc_info=debug)
+        log.error("Unexpected error: %s", e, exc_info=debug)
         sys.exit(1)
 
 
@@ -0,0 +1,34 @@
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stepfile_runner import _READ_CHUNK_SIZE, Command, StepfileRunner  # noqa: E402
+
+
+def _drain_script(script: str) -> Command:
+    command = Command(name='emit', cmd='emit', argv=[sys.executable, '-c', script])
+    runner = StepfileRunner()
+    runner._launch_all([command])
+    runner._drain([command])
+    return command
+
+
+def test_drain_discards_newline_free_output_without_debug(caplog):
+    caplog.set_level(logging.INFO, logger='stepfile_runner')
+    command = _drain_script("import sys; sys.stdout.buffer.write(b'x' * (64 << 20))")
+    assert command.exit_code == 0
+    assert not [r for r in caplog.records if r.levelno == logging.DEBUG]
+
+
+def test_drain_logs_newline_free_output_in_bounded_pieces(caplog):
+    caplog.set_level(logging.DEBUG, logger='stepfile_runner')
+    # One leading byte puts every two-byte character across the read boundaries
+    command = _drain_script("import sys; sys.stdout.buffer.write(b'a' + '\\u00e9'.encode() * (1 << 20))")
+    assert command.exit_code == 0
+
+    pieces = [r.args[2] for r in caplog.records if len(r.args) == 3 and r.args[1] == 'stdout']
+    assert ''.join(pieces) == 'a' + 'é' * (1 << 20)
+    assert len(pieces) > 1
+    assert max(len(piece.encode()) for piece in pieces) <= 2 * _READ_CHUNK_SIZE